@@ -2,8 +2,24 @@ import time
 import enum
 import asyncio
 import logging
-import importlib
-from collections import deque
+
+try:
+    import keybow as _keybow_mod
+except ImportError:
+    # Only needed for Implementation.KEYBOW; checked at construction time.
+    _keybow_mod = None
+
+
+# Cache of already-parsed hexcodes; apps tend to cycle through a few colours.
+_HEX_CACHE = {}
+
+_log = logging.getLogger()
+
+# Simulated-script ops; scripts are compiled to (op, arg) tuples at setup().
+_OP_SLEEP = 0
+_OP_DOWN = 1
+_OP_UP = 2
+_OP_MAP = {'sleep': _OP_SLEEP, 'down': _OP_DOWN, 'up': _OP_UP}
 
 
 class KeyInterfaceError(Exception):
@@ -32,11 +48,12 @@ class Implementation(enum.Enum):
 
 
 class KeyState(object):
+    __slots__ = ('_pressed', '_rgb')
+
     def __init__(self):
         self._pressed = False
-        self._r = 0
-        self._g = 0
-        self._b = 0
+        # Colour packed as a single 0xRRGGBB int.
+        self._rgb = 0
 
     @property
     def pressed(self):
@@ -56,118 +73,131 @@ class KeyState(object):
 
     @property
     def r(self):
-        return self._r
+        return (self._rgb >> 16) & 0xff
 
     @r.setter
     def r(self, var):
         try:
-            self._r = int(var)
+            self._rgb = (self._rgb & ~0xff0000) | ((int(var) & 0xff) << 16)
         except TypeError:
             raise KeyStateError('color value must be an int')
 
     @property
     def g(self):
-        return self._g
+        return (self._rgb >> 8) & 0xff
 
     @g.setter
     def g(self, var):
         try:
-            self._g = int(var)
+            self._rgb = (self._rgb & ~0x00ff00) | ((int(var) & 0xff) << 8)
         except TypeError:
             raise KeyStateError('color value must be an int')
 
     @property
     def b(self):
-        return self._b
+        return self._rgb & 0xff
 
     @b.setter
     def b(self, var):
         try:
-            self._b = int(var)
+            self._rgb = (self._rgb & ~0x0000ff) | (int(var) & 0xff)
         except TypeError:
             raise KeyStateError('color value must be an int')
 
     @property
     def colourcode(self):
-        return '%s%s%s' % (format(self.r, '02x'), format(self.g, '02x'), format(self.b, '02x'))
+        return '000000' if self._rgb == 0 else format(self._rgb, '06x')
 
     def set_colour(self, r, g, b):
-        self.r = r
-        self.g = g
-        self.b = b
+        try:
+            self._rgb = ((int(r) & 0xff) << 16) | ((int(g) & 0xff) << 8) | (int(b) & 0xff)
+        except TypeError:
+            raise KeyStateError('color value must be an int')
+
+    def _set_rgb_fast(self, r, g, b):
+        # Internal fast path for callers that already hold clean ints.
+        self._rgb = (r << 16) | (g << 8) | b
 
     def is_lit(self):
-        if self.r == self.g == self.b == 0:
-            return False
-        return True
+        return self._rgb != 0
 
     def clear(self):
-        self.r = 0
-        self.g = 0
-        self.b = 0
+        self._rgb = 0
 
     def __str__(self):
-        return '[%s] : %s' % ('X' if self.pressed else ' ', self.colourcode)
+        return f"[{'X' if self._pressed else ' '}] : {self.colourcode}"
 
 
 class KeyInterface(object):
     def __init__(self, impl=Implementation.KEYBOW):
         self._impl = impl
-        self._state = {}
+        self._state = []
         self._handlers = None
         self._last_show = None
         self._keybow = None
         self._last_press = None
+        # Created lazily in async_wait() so they bind to the running loop.
+        self._press_event = None
+        self._loop = None
         self._script = []
         self._script_position = 0
 
         if self._impl == Implementation.KEYBOW:
-            try:
-                self._keybow = importlib.import_module('keybow')
-            except ModuleNotFoundError:
+            if _keybow_mod is None:
                 raise KeyInterfaceError('keybow python module not installed')
+            self._keybow = _keybow_mod
 
     def setup(self, keycount=3, script=None):
         if script:
-            self._script = script
-        for k in range(keycount):
-            self._state[k] = KeyState()
+            try:
+                self._script = [(_OP_MAP[op], float(arg)) for op, arg in (line.split() for line in script)]
+            except (KeyError, ValueError):
+                raise KeyInterfaceError('script lines must be "sleep|down|up <number>"')
+        self._state = [KeyState() for _ in range(keycount)]
         if self._impl == Implementation.KEYBOW:
             if keycount not in (3, 12):
                 raise KeyInterfaceError('keycount must be 12 (or 3 for mini)')
             if keycount == 3:
                 self._keybow.setup(self._keybow.MINI)
 
-            def _handler(idx, state):
-                self.key_update(idx, state)
-
-            for idx in range(keycount):
-                self._handler = self._keybow.on(index=idx, handler=_handler)
+            self._handlers = [self._keybow.on(index=idx, handler=self.key_update)
+                              for idx in range(keycount)]
 
     def key_update(self, idx, state):
         self._state[idx].pressed = state
         self._last_press = (idx, state)
+        if self._loop is not None:
+            # keybow invokes handlers from RPi.GPIO's callback thread, and
+            # Event.set() isn't thread-safe, so hop onto the loop to wake
+            # async_wait().
+            self._loop.call_soon_threadsafe(self._press_event.set)
 
     def set_led(self, idx, r, g, b):
         if self._impl == Implementation.KEYBOW:
             self._keybow.set_led(idx, r, g, b)
-        self._state[idx].set_colour(r, g, b)
+        self._state[idx]._set_rgb_fast(r, g, b)
         self.show()
 
     def show(self):
         if self._impl == Implementation.KEYBOW:
             self._keybow.show()
-        for k in self._state:
-            logging.debug('[%d %s]' % (k, str(self._state[k])))
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug('state: %s', ' '.join('[%d %s]' % (k, ks) for k, ks in enumerate(self._state)))
 
     def clear(self):
         if self._impl == Implementation.KEYBOW:
             self._keybow.clear()
-        for k in self._state:
-            self._state[k].clear()
-
-    def _from_hexcode(self, code):
-        return (int(code[0:2], 16), int(code[2:4], 16), int(code[4:6], 16))
+        for ks in self._state:
+            ks.clear()
+
+    @staticmethod
+    def _from_hexcode(code):
+        rgb = _HEX_CACHE.get(code)
+        if rgb is None:
+            n = int(code, 16)
+            rgb = ((n >> 16) & 0xff, (n >> 8) & 0xff, n & 0xff)
+            _HEX_CACHE[code] = rgb
+        return rgb
 
     async def led_on(self, key_idx, hexcode):
         (r, g, b) = self._from_hexcode(hexcode)
@@ -185,40 +215,47 @@ class KeyInterface(object):
         self.set_led(key_idx, 0, 0, 0)
 
     async def all_leds_off(self):
-        for idx in self._state:
-            self.set_led(idx, 0, 0, 0)
+        self.clear()
+        self.show()
 
     async def async_wait(self):
         if self._impl == Implementation.KEYBOW:
+            if self._press_event is None:
+                self._press_event = asyncio.Event()
+                self._loop = asyncio.get_running_loop()
             while True:
                 last = self._last_press
                 if last:
                     self._last_press = None
                     return last
-                await asyncio.sleep(1.0 / 120.0)
+                # Clear only just before waiting: set() is scheduled on this
+                # loop after _last_press is written, so a press landing here
+                # still wakes the wait() below.
+                self._press_event.clear()
+                await self._press_event.wait()
         elif self._impl == Implementation.SIMULATED:
             # Run through the script
-            if self._script_position >= len(self._script):
-                logging.info('script completed')
-                self.show()
-                # wait a long time, which is good enough for testing purposes.
-                await asyncio.sleep(99999999)
-
-            cmd = self._script[self._script_position]
-            self._script_position += 1
-
-            logging.debug('script cmd: %s' % (cmd, ))
-            (op, arg) = cmd.split()
-            arg = float(arg)
-            if op == 'sleep':
-                await asyncio.sleep(arg)
-                return await self.async_wait()
-            elif op == 'down':
-                self.key_update(arg, True)
-                return (arg, True)
-            elif op == 'up':
-                self.key_update(arg, False)
-                return (arg, False)
+            while True:
+                if self._script_position >= len(self._script):
+                    logging.info('script completed')
+                    self.show()
+                    # wait a long time, which is good enough for testing purposes.
+                    await asyncio.sleep(99999999)
+
+                (op, arg) = self._script[self._script_position]
+                self._script_position += 1
+
+                logging.debug('script cmd: %d %s' % (op, arg))
+                if op == _OP_SLEEP:
+                    await asyncio.sleep(arg)
+                    continue
+                idx = int(arg)
+                if op == _OP_DOWN:
+                    self.key_update(idx, True)
+                    return (idx, True)
+                elif op == _OP_UP:
+                    self.key_update(idx, False)
+                    return (idx, False)
 
 
 class KeySequence(enum.Enum):
@@ -237,29 +274,35 @@ class KeySequenceListener(object):
         if not isinstance(interface, KeyInterface):
             raise KeySequenceListenerError('interface must be KeyInterface instance')
         self._ki = interface
-        self._tl = deque([None for x in range(50)], 50)  # A timeline of events in (timestamp: event) format.
+        self._down_ts = {}  # Last key-down time per key index.
 
     async def produce(self, q):
         """Listen for and enqueue key sequences.
             q: (asnycio.Queue) A queue to push sequences onto
         """
+        # Hoist lookups out of the per-keypress loop.
+        now = time.time
+        wait = self._ki.async_wait
+        qput = q.put
+        down_ts = self._down_ts
+        hold_enabled = KeySequence.HOLD in self._listen_for
         while True:
             result = []
-            keypress = await self._ki.async_wait()
+            keypress = await wait()
             # keypress is (key_index, bool) where True is on key down.
-            if not keypress[1]:  # key up...
+            if keypress[1]:  # key down...
+                down_ts[keypress[0]] = now()
+            else:  # key up...
                 # See if this was a press or a hold (if we care):
-                key_history = [kp for kp in list(self._tl) if kp and kp[1][0] == keypress[0]]
-                last_action = key_history[0]
-                if last_action:
-                    press_duration = (time.time() - last_action[0]) * 1000
-                    if press_duration > 500 and KeySequence.HOLD in self._listen_for:
+                last_down = down_ts.pop(keypress[0], None)
+                if last_down is not None:
+                    press_duration = (now() - last_down) * 1000
+                    if press_duration > 500 and hold_enabled:
                         result = (int(keypress[0]), KeySequence.HOLD)
                     else:
                         result = (int(keypress[0]), KeySequence.SINGLE)
 
-            self._tl.appendleft((time.time(), keypress),)
-            await q.put(result)
+            await qput(result)
 
 
 class LEDOperation(enum.Enum):
@@ -269,6 +312,8 @@ class LEDOperation(enum.Enum):
 
 
 class LEDCommand(object):
+    __slots__ = ('_key_idx', '_op', '_r', '_g', '_b', '_blink_count')
+
     def __init__(self, key_idx, op=LEDOperation.BLINK, r=0, g=0, b=0, blink_count=1):
         self._key_idx = key_idx
         self._op = op
@@ -301,7 +346,7 @@ class LEDCommand(object):
 
     @r.setter
     def r(self, val):
-        if not isinstance(int, val) or val < 0 or val > 255:
+        if not isinstance(val, int) or val < 0 or val > 255:
             raise LEDInterfaceError('value of r must be an int 0 < r < 255')
         self._r = val
 
@@ -311,9 +356,9 @@ class LEDCommand(object):
 
     @g.setter
     def g(self, val):
-        if not isinstance(int, val) or val < 0 or val > 255:
-            raise LEDInterfaceError('value of g must be an int 0 < r < 255')
-        self._r = val
+        if not isinstance(val, int) or val < 0 or val > 255:
+            raise LEDInterfaceError('value of g must be an int 0 < g < 255')
+        self._g = val
 
     @property
     def b(self):
@@ -321,9 +366,9 @@ class LEDCommand(object):
 
     @b.setter
     def b(self, val):
-        if not isinstance(int, val) or val < 0 or val > 255:
-            raise LEDInterfaceError('value of b must be an int 0 < r < 255')
-        self._r = val
+        if not isinstance(val, int) or val < 0 or val > 255:
+            raise LEDInterfaceError('value of b must be an int 0 < b < 255')
+        self._b = val
 
     @property
     def blink_count(self):